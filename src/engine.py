@@ -3,7 +3,9 @@ This is the logic of the game.
 It is a library, it is not expected to be executed directly.
 """
 from enum import IntEnum
-import random
+
+import numba
+import numpy as np
 
 class CellValue(IntEnum):
     EMPTY = 0
@@ -38,8 +40,57 @@ CELL_STR = {
     CellValue.EXPLOSION: 'X',
 }
 
+# CELL_STR as an array indexed by cell value, for converting whole boards at once.
+_CELL_CHARS = np.array([CELL_STR[value] for value in CellValue])
+
+def _AllocateCells(height: int, width: int) -> tuple[np.ndarray, np.ndarray]:
+    """Allocates (field, view_mask) with all cells HIDDEN.
+
+    Both arrays are views into one (height, width, 2) buffer, so the field value and the
+    view mask value of a cell share a cache line.
+    """
+    cells = np.empty((height, width, 2), dtype=np.uint8)
+    field = cells[:, :, 0]
+    view_mask = cells[:, :, 1]
+    view_mask[:] = CellValue.HIDDEN
+    return field, view_mask
+
+
+# Orthogonal neighbors come first so that the flood fill walks along rows and columns.
+_NEIGHBOR_OFFSETS = ((0, -1), (-1, 0), (1, 0), (0, 1), (-1, -1), (1, -1), (-1, 1), (1, 1))
+
+@numba.njit(cache=True)
+def _flood_open(field: np.ndarray, view_mask: np.ndarray, x: int, y: int, height: int, width: int) -> np.ndarray:
+    """Opens the connected region of EMPTY cells starting at (x, y) and its border.
+
+    Returns an int32 array of shape (num_opened, 2) with (x, y) of every opened cell.
+    """
+    # BFS. Cells are opened as soon as they are enqueued, so each cell is enqueued at most once.
+    queue = np.empty((height * width, 2), dtype=np.int32)
+    queue[0, 0] = x
+    queue[0, 1] = y
+    view_mask[y, x] = field[y, x]
+    head = 0
+    tail = 1
+    while head < tail:
+        tmp_x = queue[head, 0]
+        tmp_y = queue[head, 1]
+        head += 1
+        if field[tmp_y, tmp_x] != CellValue.EMPTY:
+            continue
+        for dx, dy in _NEIGHBOR_OFFSETS:
+            i = tmp_y + dy
+            j = tmp_x + dx
+            if 0 <= i < height and 0 <= j < width and view_mask[i, j] == CellValue.HIDDEN:
+                view_mask[i, j] = field[i, j]
+                queue[tail, 0] = j
+                queue[tail, 1] = i
+                tail += 1
+    return queue[:tail]
+
+
 class MinesweeperEngine:
-    def __init__(self, width: int, height:int, num_mines: int):
+    def __init__(self, width: int, height:int, num_mines: int, rng: np.random.Generator | None = None):
         assert 0 < width
         assert 0 < height
         assert 0 < num_mines < width * height
@@ -48,114 +99,114 @@ class MinesweeperEngine:
         self.num_mines = num_mines
         self.is_game_over = False
         self.num_open_cells = 0
+        self.rng = rng if rng is not None else np.random.default_rng()
         self.field, self.view_mask = self.GenerateField()
 
-    def GenerateField(self) -> tuple[list[list[CellValue]], list[list[CellValue]]]:
-        field = []
-        view_mask = []
-        for _ in range(self.height):
-            field.append([CellValue.EMPTY] * self.width)
-            view_mask.append([CellValue.HIDDEN] * self.width)
-
-        mine_positions = random.sample(
-            range(self.height * self.width),
-            k = self.num_mines)
-        for pos in mine_positions:
-            y = (pos // self.width)
-            x = (pos % self.width)
-            assert field[y][x] <= CellValue.EIGHT
-            field[y][x] = CellValue.MINE
-
-            for i in range(max(y-1, 0), min(y+2, self.height)):
-                for j in range(max(x-1, 0), min(x+2, self.width)):
-                    if field[i][j] < CellValue.EIGHT:
-                        field[i][j] += 1
+    def GenerateField(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (field, view_mask) as uint8 arrays of shape (height, width)."""
+        field, view_mask = _AllocateCells(self.height, self.width)
+
+        mine_positions = self.rng.choice(self.height * self.width, size=self.num_mines, replace=False)
+        mine_mask = np.zeros((self.height, self.width), dtype=np.uint8)
+        mine_mask[np.unravel_index(mine_positions, mine_mask.shape)] = 1
+
+        # Count mines around each cell: a 3x3 box sum of the zero-padded mine mask, done as
+        # a horizontal and a vertical 3-tap sum, minus the cell itself.
+        padded = np.pad(mine_mask, 1)
+        row_sums = padded[:, :-2] + padded[:, 1:-1] + padded[:, 2:]
+        counts = row_sums[:-2] + row_sums[1:-1] + row_sums[2:] - mine_mask
+        field[:] = np.where(mine_mask, np.uint8(CellValue.MINE), counts)
 
         return field, view_mask
 
-    def toggle_flag(self, x, y):
+    def toggle_flag(self, x, y) -> list[tuple[int, int]]:
+        """Returns (x, y) of cells whose view mask changed."""
         if self.is_game_over:
-            return
-        match self.view_mask[y][x]:
+            return []
+        match self.view_mask[y, x]:
             case CellValue.HIDDEN:
-                self.view_mask[y][x] = CellValue.FLAG
+                self.view_mask[y, x] = CellValue.FLAG
             case CellValue.FLAG:
-                self.view_mask[y][x] = CellValue.HIDDEN
+                self.view_mask[y, x] = CellValue.HIDDEN
+            case _:
+                return []
+        return [(x, y)]
 
-    def open_cell(self, x, y):
+    def open_cell(self, x, y) -> list[tuple[int, int]] | None:
+        """Returns (x, y) of cells whose view mask changed, or None if the game ended and the whole board changed."""
         if self.is_game_over:
-            return
-        if self.view_mask[y][x] != CellValue.HIDDEN:
-            return
-        match self.field[y][x]:
+            return []
+        if self.view_mask[y, x] != CellValue.HIDDEN:
+            return []
+        match self.field[y, x]:
             case CellValue.MINE:
-                for i, row in enumerate(self.field):
-                    for j, val in enumerate(row):
-                        self.view_mask[i][j] = val
-                self.view_mask[y][x] = CellValue.EXPLOSION
+                self.view_mask[:] = self.field
+                self.view_mask[y, x] = CellValue.EXPLOSION
                 self.num_open_cells = self.width * self.height
                 self.is_game_over = True
+                return None
             case CellValue.EMPTY:
-                # BFS to open the field
-                stack = [(x, y)]
-                while stack:
-                    tmp_x, tmp_y = stack.pop()
-                    if self.view_mask[tmp_y][tmp_x] != CellValue.HIDDEN:
-                        continue
-
-                    self.num_open_cells += 1
-                    self.view_mask[tmp_y][tmp_x] = self.field[tmp_y][tmp_x]
-                    if self.field[tmp_y][tmp_x] == CellValue.EMPTY:
-                        for i in range(max(0, tmp_y-1), min(self.height, tmp_y+2)):
-                            for j in range(max(0, tmp_x-1), min(self.width, tmp_x+2)):
-                                if self.view_mask[i][j] == CellValue.HIDDEN:
-                                    stack.append((j, i))
+                opened = _flood_open(self.field, self.view_mask, x, y, self.height, self.width)
+                self.num_open_cells += len(opened)
+                changed_cells = list(map(tuple, opened.tolist()))
             case _:
-                self.view_mask[y][x] = self.field[y][x]
+                self.view_mask[y, x] = self.field[y, x]
                 self.num_open_cells += 1
+                changed_cells = [(x, y)]
 
         if self.num_mines == self.height*self.width - self.num_open_cells:
-            for i, row in enumerate(self.view_mask):
-                for j, val in enumerate(row):
-                    if val == CellValue.HIDDEN:
-                        self.view_mask[i][j] = CellValue.FLAG
+            self.view_mask[self.view_mask == CellValue.HIDDEN] = CellValue.FLAG
             self.is_game_over = True
+            return None
+        return changed_cells
+
+    def hidden_safe_cells(self) -> np.ndarray:
+        """Returns flat indices (y * width + x) of hidden cells without mines."""
+        return np.flatnonzero((self.view_mask == CellValue.HIDDEN) & (self.field != CellValue.MINE))
 
     def open_one_random_cell(self):
         if self.is_game_over:
             return
 
-        while True:
-            x, y = random.randint(0, self.width-1), random.randint(0, self.height-1)
-            if self.view_mask[y][x] == CellValue.HIDDEN and self.field[y][x] != CellValue.MINE:
-                self.open_cell(x, y)
-                break
-
+        y, x = divmod(int(self.rng.choice(self.hidden_safe_cells())), self.width)
+        self.open_cell(x, y)
 
     def partially_open(self, open_ratio = 0.2):
-        while not self.is_game_over and self.open_ratio() < open_ratio:
-            self.open_one_random_cell()
+        if self.is_game_over:
+            return
+        # Walk the hidden safe cells in random order, skipping the ones that an earlier flood fill
+        # has opened. Each pick is uniform among the cells that are still hidden, same as
+        # calling open_one_random_cell() repeatedly, but without rescanning the board.
+        candidates = self.hidden_safe_cells()
+        self.rng.shuffle(candidates)
+        for pos in candidates.tolist():
+            if self.is_game_over or self.open_ratio() >= open_ratio:
+                break
+            y, x = divmod(pos, self.width)
+            if self.view_mask[y, x] == CellValue.HIDDEN:
+                self.open_cell(x, y)
 
     def open_ratio(self):
         return self.num_open_cells / (self.width*self.height)
 
     def to_str(self, is_view_mask=False):
         source = self.view_mask if is_view_mask else self.field
-        row_strs = []
-        for y in range(self.height):
-            row = []
-            for x in range(self.width):
-                if is_view_mask and source[y][x] == CellValue.HIDDEN and self.field[y][x] == CellValue.MINE:
-                    row.append("☒")
-                else:
-                    row.append(CELL_STR[source[y][x]])
-            row_strs.append(" ".join(row))
-        return "\n".join(row_strs)
+        chars = _CELL_CHARS[source]
+        if is_view_mask:
+            chars[(source == CellValue.HIDDEN) & (self.field == CellValue.MINE)] = "☒"
+        return "\n".join(" ".join(row) for row in chars.tolist())
 
     def __str__(self):
         return self.to_str(is_view_mask=True)
 
 
+# Compile the flood fill kernel at import time instead of on the first click.
+_warmup_field, _warmup_view_mask = _AllocateCells(2, 2)
+_warmup_field[:] = CellValue.EMPTY
+_flood_open(_warmup_field, _warmup_view_mask, 0, 0, 2, 2)
+del _warmup_field, _warmup_view_mask
+
+
 if __name__ == '__main__':
     engine = MinesweeperEngine(40, 10, 100)
     print(engine.to_str(False))
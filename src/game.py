@@ -1,12 +1,13 @@
-import functools
 import tkinter as tk
 import engine
 
 GAME_WIDTH = 20
 GAME_HEIGHT = 15
 GAME_MINE_RATIO = 0.25
-CELL_WIDTH = 1
-CELL_HEIGHT = 1
+CELL_SIZE_PX = 24
+CELL_FONT = ("TkDefaultFont", 12, "bold")
+HIDDEN_CELL_BG = 'grey70'
+OPEN_CELL_BG = 'grey90'
 
 CELL_COLORS = {
     engine.CellValue.EMPTY: 'black',
@@ -36,42 +37,59 @@ class MinesweeperGUI(tk.Tk):
         self.restart_button = tk.Button(self.top_frame, text="Restart", command=self.Restart)
         self.restart_button.pack(anchor="center")
         self.top_frame.pack(side="top")
-        self.game_field_frame = tk.Frame(self)
-        self.game_field_frame.pack(side="bottom")
-        self.cells = []
+        self.canvas = tk.Canvas(self, width=width*CELL_SIZE_PX, height=height*CELL_SIZE_PX, highlightthickness=0)
+        self.canvas.pack(side="bottom")
+        self.canvas.bind("<Button-1>", self.OpenClick)
+        # From the documentation is not clear which <Button-N> represents the right mouse button.
+        self.canvas.bind("<Button-2>", self.ToggleFlag)
+        self.canvas.bind("<Button-3>", self.ToggleFlag)
+
+        # Canvas item ids of the background rectangle and the text of every cell.
+        self.cell_rects = []
+        self.cell_texts = []
         for y in range(height):
-            row = []
+            rect_row = []
+            text_row = []
             for x in range(width):
-                cell = tk.Button(self.game_field_frame, text=" ", command=functools.partial(self.OpenClick, x, y), height=CELL_HEIGHT, width=CELL_WIDTH)
-
-                # From the documentation is not clear which <Button-N> represents the right mouse button.
-                cell.bind("<Button-2>", functools.partial(self.ToggleFlag, x=x, y=y))
-                cell.bind("<Button-3>", functools.partial(self.ToggleFlag, x=x, y=y))
-
-                cell.grid(row=y, column=x)
-                row.append(cell)
-            self.cells.append(row)
+                rect_row.append(self.canvas.create_rectangle(
+                    x*CELL_SIZE_PX, y*CELL_SIZE_PX, (x+1)*CELL_SIZE_PX, (y+1)*CELL_SIZE_PX, outline='grey50'))
+                text_row.append(self.canvas.create_text(
+                    (x+0.5)*CELL_SIZE_PX, (y+0.5)*CELL_SIZE_PX, text=" ", font=CELL_FONT))
+            self.cell_rects.append(rect_row)
+            self.cell_texts.append(text_row)
         self.Redraw()
 
-    def Redraw(self):
-        for y, row in enumerate(self.eng.view_mask):
-            for x, val in enumerate(row):
-                cell = self.cells[y][x]
-                state = tk.NORMAL
-                relief = tk.RAISED
-                if val not in (engine.CellValue.HIDDEN, engine.CellValue.FLAG):
-                    state = tk.DISABLED
-                    relief = tk.FLAT
-                color = CELL_COLORS[val]
-                cell.configure(text=CELL_STR[val], disabledforeground=color, fg=color, state=state, relief=relief)
+    def Redraw(self, changed_cells: list[tuple[int, int]] | None = None):
+        """Redraws the given (x, y) cells, or the whole board if changed_cells is None."""
+        if changed_cells is None:
+            changed_cells = [(x, y) for y in range(self.eng.height) for x in range(self.eng.width)]
+        for x, y in changed_cells:
+            val = self.eng.view_mask[y, x]
+            bg = OPEN_CELL_BG
+            if val in (engine.CellValue.HIDDEN, engine.CellValue.FLAG):
+                bg = HIDDEN_CELL_BG
+            self.canvas.itemconfigure(self.cell_rects[y][x], fill=bg)
+            self.canvas.itemconfigure(self.cell_texts[y][x], text=CELL_STR[val], fill=CELL_COLORS[val])
 
-    def OpenClick(self, x, y):
-        self.eng.open_cell(x, y)
-        self.Redraw()
+    def EventToCell(self, event) -> tuple[int, int] | None:
+        """Converts the pixel position of a mouse event into (x, y) of a cell."""
+        x = event.x // CELL_SIZE_PX
+        y = event.y // CELL_SIZE_PX
+        if 0 <= x < self.eng.width and 0 <= y < self.eng.height:
+            return x, y
+        return None
 
-    def ToggleFlag(self, event, x, y):
-        self.eng.toggle_flag(x, y)
-        self.Redraw()
+    def OpenClick(self, event):
+        cell = self.EventToCell(event)
+        if cell is None:
+            return
+        self.Redraw(self.eng.open_cell(*cell))
+
+    def ToggleFlag(self, event):
+        cell = self.EventToCell(event)
+        if cell is None:
+            return
+        self.Redraw(self.eng.toggle_flag(*cell))
 
     def Restart(self):
         self.eng = engine.MinesweeperEngine(width=self.eng.width, height=self.eng.height, num_mines=self.eng.num_mines)
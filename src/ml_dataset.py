@@ -5,24 +5,40 @@ The dataset defined here reuses each sample multiple times using flip and rotati
 When square samples can produce 2x more augmentations, because we can also use their transposes.
 """
 
+import collections
+import functools
+import io
+import multiprocessing
 import os
 import random
+import numpy as np
 import torch
-import gzip
 import time
+import zstandard as zstd
 
 import engine
 
 verbose_mode = 1
 
+# Number of decompressed files that MinesweeperDataset keeps in memory.
+FILE_CACHE_SIZE = 4
+
+def _ToDevice(array: np.ndarray, device: str) -> torch.Tensor:
+    """Wraps a uint8 engine array without copying and moves it to the device.
+
+    On CPU the result shares memory with the engine, so callers must not modify it.
+    """
+    return torch.from_numpy(array).to(device=device)
+
 def EngineToInputTensor(eng: engine.MinesweeperEngine, device: str) -> torch.Tensor:
     """Converts MinesweeperEngine view mask into a Pytorch Tensor"""
-    tensor = torch.tensor(eng.view_mask, dtype=torch.long, device=device)
+    # Widen to long after the transfer, so only one byte per cell crosses to the device.
+    tensor = _ToDevice(eng.view_mask, device=device).long()
     return tensor
 
 def EngineToHiddenMask(eng: engine.MinesweeperEngine, device: str) -> torch.Tensor:
     """Returns a bool tensor mask of cells that are not visible."""
-    return (EngineToInputTensor(eng=eng, device=device) == engine.CellValue.HIDDEN)
+    return (_ToDevice(eng.view_mask, device=device) == engine.CellValue.HIDDEN)
 
 def EngineToLabelsTensor(eng: engine.MinesweeperEngine, device: str) -> torch.Tensor:
     """Creates training labels.
@@ -32,14 +48,13 @@ def EngineToLabelsTensor(eng: engine.MinesweeperEngine, device: str) -> torch.Te
         1 indicates cells with mines
         -100 is set for visible cells to avoid training on them.
     """
-    field_tensor = torch.tensor(eng.field, dtype=torch.long, device=device)
-    is_mine_tensor = (field_tensor > engine.CellValue.EIGHT).long().to(device)
+    is_mine_tensor = (_ToDevice(eng.field, device=device) > engine.CellValue.EIGHT).long()
     mask_tensor = EngineToHiddenMask(eng=eng, device=device)
-    return torch.where(mask_tensor, is_mine_tensor, -100).to(device)
+    return torch.where(mask_tensor, is_mine_tensor, -100)
 
 
 def _MakeFileName(file_idx: int, width=64, height=32, num_samples_per_file=100, data_dir="./data") -> str:
-    return os.path.join(data_dir, f"minesweeper_{width}x{height}_per_file_{num_samples_per_file}_file_idx_{file_idx}.pt.gz")
+    return os.path.join(data_dir, f"minesweeper_{width}x{height}_per_file_{num_samples_per_file}_file_idx_{file_idx}.pt.zst")
 
 
 class DatasetGenerator:
@@ -50,6 +65,8 @@ class DatasetGenerator:
         self.board_size = width * height
         self.save_dir = save_dir
         self.dtype = dtype
+        # Number of zstd compression threads per file, -1 means one per CPU.
+        self.compression_threads = -1
         os.makedirs(save_dir, exist_ok=True)
 
     def GenerateOneFile(self, file_idx: int, override=False) -> None:
@@ -66,29 +83,37 @@ class DatasetGenerator:
         save_list = []
         for sample_id in range(self.num_samples_per_file):
             idx = file_idx * self.num_samples_per_file + sample_id
-            random.seed(idx)
-            num_mines = random.randint(int(self.board_size*0.05), self.board_size//2)
-            eng = engine.MinesweeperEngine(width=self.width, height=self.height, num_mines=num_mines)
-            eng.partially_open(open_ratio=random.random() * 0.3 + 0.1)
+            rng = np.random.default_rng(idx)
+            num_mines = int(rng.integers(int(self.board_size*0.05), self.board_size//2, endpoint=True))
+            eng = engine.MinesweeperEngine(width=self.width, height=self.height, num_mines=num_mines, rng=rng)
+            eng.partially_open(open_ratio=rng.random() * 0.3 + 0.1)
             if verbose_mode >= 2 and sample_id % 50 == 0:
                 print(f"{idx=}")
                 print(eng.to_str(is_view_mask=True))
             save_list.append((
                 EngineToInputTensor(eng, device="cpu").to(self.dtype),
                 EngineToLabelsTensor(eng, device="cpu").to(self.dtype)))
-        with gzip.open(filename=file_name, mode='wb') as file_obj:
-            torch.save(save_list, file_obj)
+        compressor = zstd.ZstdCompressor(level=3, threads=self.compression_threads)
+        with open(file_name, mode='wb') as file_obj, compressor.stream_writer(file_obj) as writer:
+            torch.save(save_list, writer)
         elapsed_t = time.time() - start_t
         if verbose_mode >= 1:
             print(f"generated {file_name} in {elapsed_t:.2f}s")
 
-    def GenerateDataset(self, num_files: int, override=False) -> None:
-        for file_idx in range(num_files):
-            self.GenerateOneFile(file_idx, override=override)
+    def GenerateDataset(self, num_files: int, override=False, num_processes: int | None = None) -> None:
+        """Generates files in parallel. num_processes defaults to the number of CPUs."""
+        # The pool already keeps every CPU busy, so each worker compresses on a single thread.
+        compression_threads = self.compression_threads
+        self.compression_threads = 0
+        try:
+            with multiprocessing.Pool(num_processes) as pool:
+                pool.map(functools.partial(self.GenerateOneFile, override=override), range(num_files))
+        finally:
+            self.compression_threads = compression_threads
 
 
 class MinesweeperDataset(torch.utils.data.Dataset):
-    def __init__(self, width=128, height=128, num_samples_per_file=1000, data_dir="./data", shuffle=False):
+    def __init__(self, width=128, height=128, num_samples_per_file=1000, data_dir="./data", shuffle=False, seed: int | None = None):
         super().__init__()
         self.width = width
         self.height = height
@@ -96,15 +121,24 @@ class MinesweeperDataset(torch.utils.data.Dataset):
         self.data_dir = data_dir
         self.num_files, self.num_samples = self.ScanDir()
         self.shuffle = shuffle
+        # Shuffling uses local Random instances derived from this seed instead of the global
+        # random state, so every DataLoader worker shuffles a given file the same way.
+        self.seed = seed if seed is not None else random.SystemRandom().getrandbits(64)
         self.file_indicies = list(range(self.num_files))
         self.num_augmentations = 4
         if width == height:
             self.num_augmentations *= 2
         if self.shuffle:
-            random.shuffle(self.file_indicies)
+            random.Random(self.seed).shuffle(self.file_indicies)
         assert self.num_samples > 0, f"No matching data files in '{data_dir}'"
-        self.current_file_idx: int | None = None
-        self.current_file_content: list[tuple[torch.Tensor, torch.Tensor]] | None = None
+        # LRU cache of LoadFile() results, most recently used last.
+        self.file_cache: collections.OrderedDict[int, tuple[torch.Tensor, list[int] | None]] = collections.OrderedDict()
+
+    def __getstate__(self):
+        # DataLoader workers start with an empty cache instead of a pickled copy of the parent's.
+        state = self.__dict__.copy()
+        state["file_cache"] = collections.OrderedDict()
+        return state
 
     def ScanDir(self) -> int:
         file_idx = 0
@@ -124,50 +158,87 @@ class MinesweeperDataset(torch.utils.data.Dataset):
     def __len__(self):
         return self.num_samples * self.num_augmentations
 
-    def AugmentSample(self, record_idx, augmentation_idx):
-        a, b = self.current_file_content[record_idx]
-        assert a.shape == (self.height, self.width), a.shape
-        assert b.shape == (self.height, self.width), b.shape
+    def AugmentFile(self, content: list[tuple[torch.Tensor, torch.Tensor]]) -> torch.Tensor:
+        """Stacks all records of a file and applies every flip to the whole stack at once.
+
+        Returns a tensor of shape (4, num_records, 2, height, width), where [:, :, 0] are the
+        inputs and [:, :, 1] are the labels. Transposed augmentations are not stored, they are
+        taken as views in GetAugmentedRecord().
+        """
+        records = torch.stack([torch.stack(record) for record in content])
+        assert records.shape[-2:] == (self.height, self.width), records.shape
+        return torch.stack([records, records.flip(-1), records.flip(-2), records.flip(-2, -1)])
+
+    def GetAugmentedRecord(self, flips: torch.Tensor, record_idx: int, augmentation_idx: int) -> torch.Tensor:
+        """Returns a (2, height, width) tensor of the record from the AugmentFile() output."""
         if augmentation_idx // 4 == 1:
             assert self.height == self.width
-            a = a.T
-            b = b.T
-        match augmentation_idx % 4:
-            case 0:
-                ...
-            case 1:
-                a = a.fliplr()
-                b = b.fliplr()
-            case 2:
-                a = a.flipud()
-                b = b.flipud()
-            case 3:
-                a = a.rot90(k=2)
-                b = b.rot90(k=2)
-        return a.long(), b.long()
+            # Transposing swaps horizontal and vertical flips: (x.T).fliplr() == (x.flipud()).T
+            flip_idx = (0, 2, 1, 3)[augmentation_idx % 4]
+            return flips[flip_idx, record_idx].transpose(-2, -1)
+        return flips[augmentation_idx, record_idx]
+
+    def LoadFile(self, file_idx: int) -> tuple[torch.Tensor, list[int] | None]:
+        """Loads a file and returns its records with all flips applied, see AugmentFile().
+
+        When shuffling, also returns the order in which the (record, augmentation) positions of
+        the file are visited, otherwise None.
+
+        The last FILE_CACHE_SIZE files are cached, so a shuffled access pattern does not
+        decompress the same file over and over. Each DataLoader worker has its own cache.
+        """
+        if file_idx in self.file_cache:
+            self.file_cache.move_to_end(file_idx)
+            return self.file_cache[file_idx]
+        file_name = _MakeFileName(
+            file_idx=file_idx,
+            width=self.width,
+            height=self.height,
+            num_samples_per_file=self.num_samples_per_file,
+            data_dir=self.data_dir)
+        start_t = time.time()
+        # Read the whole compressed file at once and decompress it in memory.
+        # decompressobj() is used because streamed frames do not record their decompressed size.
+        with open(file_name, mode='rb') as f:
+            raw = f.read()
+        content = torch.load(io.BytesIO(zstd.ZstdDecompressor().decompressobj().decompress(raw)))
+        augmented = self.AugmentFile(content)
+        order = None
+        if self.shuffle:
+            order = list(range(self.num_samples_per_file * self.num_augmentations))
+            random.Random(f"{self.seed}/{file_idx}").shuffle(order)
+        elapsed_t = time.time() - start_t
+        if verbose_mode >= 2:
+            print(f"fetched file {file_name} in {elapsed_t:.2f}s")
+        self.file_cache[file_idx] = (augmented, order)
+        if len(self.file_cache) > FILE_CACHE_SIZE:
+            self.file_cache.popitem(last=False)
+        return augmented, order
 
     def __getitem__(self, idx):
         assert idx < len(self), (idx, len(self))
-        augmentation_idx = idx // self.num_samples
-        file_idx = self.file_indicies[(idx % self.num_samples) // self.num_samples_per_file]
-        record_idx = idx % self.num_samples_per_file
-        if self.current_file_idx != file_idx:
-            file_name = _MakeFileName(
-                file_idx=file_idx,
-                width=self.width,
-                height=self.height,
-                num_samples_per_file=self.num_samples_per_file,
-                data_dir=self.data_dir)
-            start_t = time.time()
-            with gzip.open(file_name, mode='rb') as f:
-                self.current_file_content = torch.load(f)
-                if self.shuffle:
-                    random.shuffle(self.current_file_content)
-            self.current_file_idx = file_idx
-            elapsed_t = time.time() - start_t
-            if verbose_mode >= 2:
-                print(f"fetched file {file_name} in {elapsed_t:.2f}s")
-        return self.AugmentSample(record_idx=record_idx, augmentation_idx=augmentation_idx)
+        # All records of a file are adjacent, so sequential reads decompress each file only once.
+        # Without shuffling the augmentations of a record are adjacent too. With shuffling they are
+        # spread over the whole file, so that a batch does not repeat the same board.
+        records_per_file = self.num_samples_per_file * self.num_augmentations
+        file_idx = self.file_indicies[idx // records_per_file]
+        flips, order = self.LoadFile(file_idx)
+        position = idx % records_per_file
+        if order is not None:
+            position = order[position]
+        record_idx, augmentation_idx = divmod(position, self.num_augmentations)
+        # Samples stay int8 to keep DataLoader batches small, see BatchToDevice().
+        a, b = self.GetAugmentedRecord(flips, record_idx=record_idx, augmentation_idx=augmentation_idx)
+        return a, b
+
+def BatchToDevice(batch: tuple[torch.Tensor, torch.Tensor], device: str) -> tuple[torch.Tensor, torch.Tensor]:
+    """Moves an int8 (inputs, labels) batch from MinesweeperDataset to the device and converts it to long.
+
+    The conversion happens after the transfer, so 8x fewer bytes are copied to the device.
+    """
+    a, b = batch
+    return a.to(device).long(), b.to(device).long()
+
 
 if __name__ == "__main__":
     # This module is meant to be used as a library and not as a stand-alone executable.